@@ -1,12 +1,196 @@
 # database.py
+import asyncio
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 import aiosqlite
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, UTC
+from functools import lru_cache
+from typing import NamedTuple
+import zoneinfo
 
 DB_PATH = "alarm_bot.db"
+SCHEMA_VERSION = 1  # bump together with a migration step in init_db
+
+_db: aiosqlite.Connection | None = None
+_db_lock = asyncio.Lock()
+_write_lock = asyncio.Lock()
+
+TZ_CACHE_SIZE = 1024
+_tz_cache: OrderedDict[int, str] = OrderedDict()
+
+# guild_id -> (log_channel_id, log_deletes, log_edits, log_bulk_deletes), or None
+# for guilds without settings. One entry per guild, kept current by the writers.
+_log_cache: dict[int, tuple | None] = {}
+_log_cache_loaded = False  # set by load_log_settings: a miss then means "no settings"
+
+class DueAlarm(NamedTuple):
+    id: int
+    user_id: int
+    time: str
+    message: str
+    channel_id: int | None
+    timezone: str
+    repeat: str | None
+
+# Hot-path statements are kept as module constants so every call passes the
+# same SQL text and hits the connection's prepared-statement cache.
+_SQL_GET_TIMEZONE = "SELECT timezone FROM user_timezones WHERE user_id=?"
+
+_SQL_ADD_ALARM = """
+    INSERT INTO alarms (user_id, time_utc, time_utc_epoch, message, channel_id, timezone, repeat, paused, created_at_utc)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)
+    RETURNING id
+"""
+
+_SQL_GET_USER_ALARMS = """
+    SELECT id, user_id, time_utc, message, channel_id, timezone, repeat, paused, time_utc_epoch
+    FROM alarms
+    WHERE user_id=?
+    ORDER BY time_utc ASC
+"""
+
+_SQL_GET_ALARM = """
+    SELECT id, user_id, time_utc, message, channel_id, timezone, repeat, paused, time_utc_epoch
+    FROM alarms
+    WHERE id=? AND user_id=?
+"""
+
+_SQL_GET_DUE = """
+    SELECT id, user_id, time_utc, message, channel_id, timezone, repeat
+    FROM alarms
+    WHERE paused=0 AND time_utc_epoch <= ?
+    ORDER BY time_utc_epoch ASC
+"""
+
+_SQL_SET_ALARM_TIME = "UPDATE alarms SET time_utc=?, time_utc_epoch=? WHERE id=?"
+
+_SQL_DELETE_ALARM = "DELETE FROM alarms WHERE id=?"
+
+# Whole periods past the cutoff (?1): occurrences missed while the bot was down
+# are skipped in one step and the alarm keeps its original time of day
+_PERIOD = "CASE repeat WHEN 'weekly' THEN 604800 ELSE 86400 END"
+_NEXT_EPOCH = f"time_utc_epoch + {_PERIOD} * ((?1 - time_utc_epoch) / {_PERIOD} + 1)"
+
+_SQL_ADVANCE_REPEATING = f"""
+    UPDATE alarms
+    SET time_utc_epoch = {_NEXT_EPOCH},
+        time_utc = strftime('%Y-%m-%dT%H:%M:%S+00:00', {_NEXT_EPOCH}, 'unixepoch')
+    WHERE paused=0 AND repeat IS NOT NULL AND timezone='UTC' AND time_utc_epoch <= ?1
+    RETURNING time_utc_epoch, id
+"""
+
+_LOG_COLUMNS = "log_channel_id, log_deletes, log_edits, log_bulk_deletes"
+
+_SQL_GET_LOG_SETTINGS = f"SELECT {_LOG_COLUMNS} FROM guild_log_settings WHERE guild_id=?"
+
+async def _configure(db: aiosqlite.Connection):
+    # Per-connection settings; journal_mode=WAL is persisted in the file by init_db
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA mmap_size=268435456")
+    await db.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+
+async def _conn() -> aiosqlite.Connection:
+    # One long-lived connection keeps the page cache warm between calls
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(DB_PATH)
+                db.row_factory = aiosqlite.Row
+                await _configure(db)
+                _db = db
+    return _db
+
+async def close_db():
+    global _db
+    if _db is not None:
+        db, _db = _db, None
+        await db.close()
+
+@asynccontextmanager
+async def _writer_txn():
+    # Writers share one connection: serialize them and take the write lock up front
+    # (BEGIN IMMEDIATE) so SQLite never has to upgrade a read transaction mid-flight
+    db = await _conn()
+    async with _write_lock:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+
+async def _columns(db: aiosqlite.Connection, table: str) -> set[str]:
+    async with db.execute(f"PRAGMA table_info({table})") as cur:
+        return {row[1] for row in await cur.fetchall()}
+
+async def _migrate_legacy_tables(db: aiosqlite.Connection):
+    # Databases created by the first version of this bot used alarms.time (naive UTC ISO)
+    # and a log_settings table; move them aside so the current schema can be created
+    alarm_columns = await _columns(db, "alarms")
+    if "time" in alarm_columns and "time_utc" not in alarm_columns:
+        await db.execute("ALTER TABLE alarms RENAME TO alarms_legacy")
+
+async def _copy_legacy_rows(db: aiosqlite.Connection):
+    legacy_alarm_columns = await _columns(db, "alarms_legacy")
+    if legacy_alarm_columns:
+        repeat = "repeat" if "repeat" in legacy_alarm_columns else "NULL"
+        await db.execute(f"""
+        INSERT INTO alarms (id, user_id, time_utc, time_utc_epoch, message, channel_id,
+                            timezone, repeat, paused, created_at_utc)
+        SELECT id, user_id,
+               strftime('%Y-%m-%dT%H:%M:%S+00:00', time),
+               CAST(strftime('%s', time) AS INTEGER),
+               COALESCE(message, 'Alarm!'), channel_id,
+               COALESCE(timezone, 'UTC'), {repeat}, 0,
+               strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')
+        FROM alarms_legacy
+        """)
+        await db.execute("DROP TABLE alarms_legacy")
+
+    if await _columns(db, "log_settings"):
+        await db.execute("""
+        INSERT OR IGNORE INTO guild_log_settings (guild_id, log_channel_id, log_deletes)
+        SELECT guild_id, channel_id, COALESCE(log_deletes, 0) FROM log_settings
+        """)
+        await db.execute("DROP TABLE log_settings")
+
+async def _canonicalize_timezones(db: aiosqlite.Connection):
+    # Names validated by pytz were stored as typed ("asia/dhaka"); zoneinfo only
+    # accepts the exact IANA key. Anything zoneinfo doesn't know falls back to UTC.
+    for table in ("user_timezones", "alarms"):
+        async with db.execute(f"SELECT DISTINCT timezone FROM {table}") as cur:
+            names = [row[0] for row in await cur.fetchall()]
+        renames = [(canonical_timezone(name) or "UTC", name) for name in names]
+        await db.executemany(
+            f"UPDATE {table} SET timezone=? WHERE timezone=?",
+            [(new, old) for new, old in renames if new != old],
+        )
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    db = await _conn()
+    async with db.execute("PRAGMA user_version") as cur:
+        (version,) = await cur.fetchone()
+    if version >= SCHEMA_VERSION:
+        # Warm start: schema is already current, no DDL to run
+        return
+
+    await db.execute("PRAGMA journal_mode=WAL")
+
+    # auto_vacuum only takes effect on an empty file or after a full VACUUM, and VACUUM
+    # can't run inside a transaction; after this, cleanup reclaims pages incrementally
+    async with db.execute("PRAGMA auto_vacuum") as cur:
+        (auto_vacuum,) = await cur.fetchone()
+    if auto_vacuum != 2:  # 2 = INCREMENTAL
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+
+    async with _writer_txn() as db:
+        await _migrate_legacy_tables(db)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS user_timezones (
             user_id INTEGER PRIMARY KEY,
@@ -24,9 +208,13 @@ async def init_db():
             timezone TEXT NOT NULL DEFAULT 'UTC',
             repeat TEXT,              -- 'daily' | 'weekly' | NULL
             paused INTEGER NOT NULL DEFAULT 0,
-            created_at_utc TEXT NOT NULL
+            created_at_utc TEXT NOT NULL,
+            time_utc_epoch INTEGER    -- time_utc as unix seconds, used by the scheduler
         )
         """)
+        if "time_utc_epoch" not in await _columns(db, "alarms"):
+            await db.execute("ALTER TABLE alarms ADD COLUMN time_utc_epoch INTEGER")
+            await db.execute("UPDATE alarms SET time_utc_epoch = CAST(strftime('%s', time_utc) AS INTEGER)")
 
         await db.execute("""
         CREATE TABLE IF NOT EXISTS guild_log_settings (
@@ -37,180 +225,244 @@ async def init_db():
             log_bulk_deletes INTEGER NOT NULL DEFAULT 0
         )
         """)
-        await db.commit()
+
+        await _copy_legacy_rows(db)
+        await _canonicalize_timezones(db)
+
+        # get_due_alarms: paused=0 AND time_utc_epoch <= ? ORDER BY time_utc_epoch
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_alarms_due_epoch ON alarms(paused, time_utc_epoch)")
+        # iter_user_alarms: user_id=? ORDER BY time_utc
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_alarms_user_time ON alarms(user_id, time_utc)")
+
+        await db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
 
 # ---------- Timezones ----------
+@lru_cache(maxsize=1)
+def _zone_names() -> dict[str, str]:
+    return {name.lower(): name for name in zoneinfo.available_timezones()}
+
+def canonical_timezone(name: str) -> str | None:
+    # IANA spelling of name, matched case-insensitively; None if zoneinfo doesn't know it
+    return _zone_names().get(name.lower())
+
+def _cache_timezone(user_id: int, timezone: str):
+    _tz_cache[user_id] = timezone
+    _tz_cache.move_to_end(user_id)
+    if len(_tz_cache) > TZ_CACHE_SIZE:
+        _tz_cache.popitem(last=False)
+
 async def set_user_timezone(user_id: int, timezone: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _writer_txn() as db:
         await db.execute("""
         INSERT INTO user_timezones (user_id, timezone)
         VALUES (?, ?)
         ON CONFLICT(user_id) DO UPDATE SET timezone=excluded.timezone
         """, (user_id, timezone))
-        await db.commit()
+    _cache_timezone(user_id, timezone)
 
 async def get_user_timezone(user_id: int) -> str:
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT timezone FROM user_timezones WHERE user_id=?", (user_id,)) as cur:
-            row = await cur.fetchone()
-    return row[0] if row else "UTC"
+    timezone = _tz_cache.get(user_id)
+    if timezone is not None:
+        _tz_cache.move_to_end(user_id)
+        return timezone
+
+    db = await _conn()
+    async with db.execute(_SQL_GET_TIMEZONE, (user_id,)) as cur:
+        row = await cur.fetchone()
+    timezone = row[0] if row else "UTC"
+    _cache_timezone(user_id, timezone)
+    return timezone
 
 # ---------- Alarms ----------
+def _utc_fields(dt: datetime) -> tuple[str, int]:
+    # (time_utc, time_utc_epoch) column values for a datetime
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    dt = dt.astimezone(UTC)
+    return dt.isoformat(), int(dt.timestamp())
+
 async def add_alarm(user_id: int, time_utc: datetime, message: str, channel_id: int | None, timezone: str, repeat: str | None):
-    if time_utc.tzinfo is None:
-        time_utc = pytz.UTC.localize(time_utc)
-    time_utc_str = time_utc.astimezone(pytz.UTC).isoformat()
-    created_at = datetime.now(pytz.UTC).isoformat()
+    time_utc_str, time_utc_epoch = _utc_fields(time_utc)
+    created_at = datetime.now(UTC).isoformat()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("""
-        INSERT INTO alarms (user_id, time_utc, message, channel_id, timezone, repeat, paused, created_at_utc)
-        VALUES (?, ?, ?, ?, ?, ?, 0, ?)
-        """, (user_id, time_utc_str, message, channel_id, timezone, repeat, created_at))
-        await db.commit()
-        return cur.lastrowid
-
-async def get_user_alarms(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT id, user_id, time_utc, message, channel_id, timezone, repeat, paused
-            FROM alarms
-            WHERE user_id=?
-            ORDER BY time_utc ASC
-        """, (user_id,)) as cur:
-            rows = await cur.fetchall()
-
-    alarms = []
-    for r in rows:
-        alarms.append({
-            "id": r[0],
-            "user_id": r[1],
-            "time": r[2],
-            "message": r[3],
-            "channel_id": r[4],
-            "timezone": r[5],
-            "repeat": r[6],
-            "paused": bool(r[7]),
-        })
-    return alarms
-
-async def get_due_alarms():
-    now_utc = datetime.now(pytz.UTC).isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT id, user_id, time_utc, message, channel_id, timezone, repeat, paused
-            FROM alarms
-            WHERE paused=0 AND time_utc <= ?
-            ORDER BY time_utc ASC
-        """, (now_utc,)) as cur:
-            rows = await cur.fetchall()
-
-    alarms = []
-    for r in rows:
-        alarms.append({
-            "id": r[0],
-            "user_id": r[1],
-            "time": r[2],
-            "message": r[3],
-            "channel_id": r[4],
-            "timezone": r[5],
-            "repeat": r[6],
-            "paused": bool(r[7]),
-        })
-    return alarms
-
-async def delete_alarm(alarm_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("DELETE FROM alarms WHERE id=?", (alarm_id,))
-        await db.commit()
+    async with _writer_txn() as db:
+        cur = await db.execute(_SQL_ADD_ALARM, (user_id, time_utc_str, time_utc_epoch, message, channel_id,
+                                                timezone, repeat, created_at))
+        row = await cur.fetchone()
+    return row[0]
 
-async def update_alarm_time(alarm_id: int, next_time_utc: datetime):
-    if next_time_utc.tzinfo is None:
-        next_time_utc = pytz.UTC.localize(next_time_utc)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE alarms SET time_utc=? WHERE id=?",
-                         (next_time_utc.astimezone(pytz.UTC).isoformat(), alarm_id))
-        await db.commit()
+def _alarm_dict(r) -> dict:
+    return {
+        "id": r[0],
+        "user_id": r[1],
+        "time": r[2],
+        "message": r[3],
+        "channel_id": r[4],
+        "timezone": r[5],
+        "repeat": r[6],
+        "paused": bool(r[7]),
+        "time_epoch": r[8],
+    }
+
+async def get_alarm(alarm_id: int, user_id: int) -> dict | None:
+    # Primary-key lookup scoped to the owner; None if missing or someone else's
+    db = await _conn()
+    async with db.execute(_SQL_GET_ALARM, (alarm_id, user_id)) as cur:
+        r = await cur.fetchone()
+    return _alarm_dict(r) if r else None
+
+async def alarm_exists(alarm_id: int, user_id: int) -> bool:
+    # id is the primary key, so this is one rowid probe plus the owner check
+    db = await _conn()
+    async with db.execute("SELECT 1 FROM alarms WHERE id=? AND user_id=?", (alarm_id, user_id)) as cur:
+        return await cur.fetchone() is not None
+
+async def iter_user_alarms(user_id: int) -> AsyncIterator[dict]:
+    # Streams rows so callers that only show the first page never load the rest
+    db = await _conn()
+    async with db.execute(_SQL_GET_USER_ALARMS, (user_id,)) as cur:
+        async for r in cur:
+            yield _alarm_dict(r)
+
+async def get_due_alarms(cutoff_utc: datetime | None = None) -> list[DueAlarm]:
+    now_epoch = int((cutoff_utc or datetime.now(UTC)).timestamp())
+    db = await _conn()
+    async with db.execute(_SQL_GET_DUE, (now_epoch,)) as cur:
+        rows = await cur.fetchall()
+    # The scheduler runs this every tick; plain tuples avoid a dict per row
+    make = DueAlarm._make
+    return [make(r) for r in rows]
+
+async def get_alarm_schedule() -> list[tuple[int, int]]:
+    # (time_utc_epoch, id) of every active alarm, used to seed the scheduler heap
+    db = await _conn()
+    async with db.execute("SELECT time_utc_epoch, id FROM alarms WHERE paused=0") as cur:
+        return [tuple(r) for r in await cur.fetchall()]
+
+async def delete_alarm_if_owned(user_id: int, alarm_id: int) -> bool:
+    # Ownership check and delete in one statement; False if missing or not the user's
+    async with _writer_txn() as db:
+        async with db.execute("DELETE FROM alarms WHERE id=? AND user_id=? RETURNING id", (alarm_id, user_id)) as cur:
+            row = await cur.fetchone()
+    return row is not None
+
+async def cleanup_expired_alarms(max_age: timedelta = timedelta(days=30)) -> int:
+    # Retention policy: a paused one-time alarm whose time is more than max_age ago
+    # would only fire late if resumed, so it is dropped. Unpaused alarms are left
+    # alone however overdue (the scheduler fires them after downtime), and so are
+    # recurring ones.
+    cutoff_epoch = int((datetime.now(UTC) - max_age).timestamp())
+    async with _writer_txn() as db:
+        cur = await db.execute(
+            "DELETE FROM alarms WHERE repeat IS NULL AND paused=1 AND time_utc_epoch < ?", (cutoff_epoch,)
+        )
+    if cur.rowcount:
+        # Hand freed pages back to the OS. execute() would only step this pragma once
+        # (one page); executescript runs it to completion but must not split a writer txn
+        async with _write_lock:
+            await db.executescript("PRAGMA incremental_vacuum(1000);")
+    return cur.rowcount
 
 async def update_alarm(alarm_id: int, new_time_utc: datetime, repeat: str | None, message: str):
-    if new_time_utc.tzinfo is None:
-        new_time_utc = pytz.UTC.localize(new_time_utc)
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _writer_txn() as db:
         await db.execute("""
             UPDATE alarms
-            SET time_utc=?, repeat=?, message=?
+            SET time_utc=?, time_utc_epoch=?, repeat=?, message=?
             WHERE id=?
-        """, (new_time_utc.astimezone(pytz.UTC).isoformat(), repeat, message, alarm_id))
-        await db.commit()
+        """, (*_utc_fields(new_time_utc), repeat, message, alarm_id))
+
+async def reschedule_due(updates: list[tuple[datetime, int]], deletes: list[int]):
+    # Apply a whole scheduler tick in one transaction (one commit instead of one per alarm)
+    fields = _utc_fields
+    update_rows = [(*fields(t), alarm_id) for t, alarm_id in updates]
+    delete_rows = [(alarm_id,) for alarm_id in deletes]
+    async with _writer_txn() as db:
+        executemany = db.executemany
+        await executemany(_SQL_SET_ALARM_TIME, update_rows)
+        await executemany(_SQL_DELETE_ALARM, delete_rows)
 
 async def set_alarm_paused(alarm_id: int, paused: bool):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _writer_txn() as db:
         await db.execute("UPDATE alarms SET paused=? WHERE id=?", (1 if paused else 0, alarm_id))
-        await db.commit()
 
-async def snooze_alarm(alarm_id: int, delta: timedelta):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT time_utc FROM alarms WHERE id=?", (alarm_id,)) as cur:
-            row = await cur.fetchone()
-        if not row:
-            return False
-        old_time = datetime.fromisoformat(row[0])
-        if old_time.tzinfo is None:
-            old_time = pytz.UTC.localize(old_time)
-        new_time = old_time + delta
-        await db.execute("UPDATE alarms SET time_utc=? WHERE id=?", (new_time.astimezone(pytz.UTC).isoformat(), alarm_id))
-        await db.commit()
-        return True
+async def advance_repeating_due(cutoff_utc: datetime) -> list[tuple[int, int]]:
+    # UTC alarms have no DST, so their rollover can be done in SQL in one statement;
+    # other timezones go through compute_next_recurring_utc + reschedule_due.
+    # Returns the new (time_utc_epoch, id) of every alarm it moved.
+    async with _writer_txn() as db:
+        cur = await db.execute(_SQL_ADVANCE_REPEATING, (int(cutoff_utc.timestamp()),))
+        rows = await cur.fetchall()
+    return [tuple(r) for r in rows]
+
+async def snooze_alarm(alarm_id: int, delta: timedelta) -> int | None:
+    # Returns the new time_utc_epoch, or None if the alarm does not exist
+    seconds = int(delta.total_seconds())
+    async with _writer_txn() as db:
+        cur = await db.execute("""
+            UPDATE alarms
+            SET time_utc_epoch = time_utc_epoch + ?,
+                time_utc = strftime('%Y-%m-%dT%H:%M:%S+00:00', time_utc_epoch + ?, 'unixepoch')
+            WHERE id=?
+            RETURNING time_utc_epoch
+        """, (seconds, seconds, alarm_id))
+        row = await cur.fetchone()
+    return row[0] if row else None
 
 # ---------- Logging settings ----------
 async def set_log_channel(guild_id: int, channel_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
+    async with _writer_txn() as db:
+        async with db.execute(f"""
         INSERT INTO guild_log_settings (guild_id, log_channel_id)
         VALUES (?, ?)
         ON CONFLICT(guild_id) DO UPDATE SET log_channel_id=excluded.log_channel_id
-        """, (guild_id, channel_id))
-        await db.commit()
+        RETURNING {_LOG_COLUMNS}
+        """, (guild_id, channel_id)) as cur:
+            row = await cur.fetchone()
+    _log_cache[guild_id] = tuple(row)
+
+async def load_log_settings():
+    # One query at startup so events from guilds without logging never reach the DB
+    global _log_cache_loaded
+    db = await _conn()
+    async with db.execute(f"SELECT guild_id, {_LOG_COLUMNS} FROM guild_log_settings") as cur:
+        rows = await cur.fetchall()
+    for r in rows:
+        _log_cache.setdefault(r[0], tuple(r[1:]))
+    _log_cache_loaded = True
 
 async def get_log_settings(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("""
-            SELECT log_channel_id, log_deletes, log_edits, log_bulk_deletes
-            FROM guild_log_settings
-            WHERE guild_id=?
+    # Read on every message/member/voice event, so served from _log_cache
+    try:
+        return _log_cache[guild_id]
+    except KeyError:
+        if _log_cache_loaded:
+            return None
+    db = await _conn()
+    async with db.execute(_SQL_GET_LOG_SETTINGS, (guild_id,)) as cur:
+        row = await cur.fetchone()
+    # setdefault: a writer that committed while we were reading has the newer row
+    return _log_cache.setdefault(guild_id, tuple(row) if row else None)  # (channel_id, deletes, edits, bulk)
+
+async def _toggle(column: str, guild_id: int):
+    # column is one of the fixed log_* flags below, never user input
+    async with _writer_txn() as db:
+        async with db.execute(f"""
+            UPDATE guild_log_settings
+            SET {column} = 1 - {column}
+            WHERE guild_id=? AND log_channel_id IS NOT NULL
+            RETURNING {_LOG_COLUMNS}, {column}
         """, (guild_id,)) as cur:
             row = await cur.fetchone()
-    return row  # (channel_id, deletes, edits, bulk)
+    if not row:
+        return None
+    _log_cache[guild_id] = tuple(row[:4])
+    return bool(row[4])
 
 async def toggle_delete_logging(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT log_channel_id, log_deletes FROM guild_log_settings WHERE guild_id=?", (guild_id,)) as cur:
-            row = await cur.fetchone()
-        if not row or not row[0]:
-            return None
-        new_val = 0 if row[1] else 1
-        await db.execute("UPDATE guild_log_settings SET log_deletes=? WHERE guild_id=?", (new_val, guild_id))
-        await db.commit()
-        return bool(new_val)
+    return await _toggle("log_deletes", guild_id)
 
 async def toggle_edit_logging(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT log_channel_id, log_edits FROM guild_log_settings WHERE guild_id=?", (guild_id,)) as cur:
-            row = await cur.fetchone()
-        if not row or not row[0]:
-            return None
-        new_val = 0 if row[1] else 1
-        await db.execute("UPDATE guild_log_settings SET log_edits=? WHERE guild_id=?", (new_val, guild_id))
-        await db.commit()
-        return bool(new_val)
+    return await _toggle("log_edits", guild_id)
 
 async def toggle_bulk_delete_logging(guild_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT log_channel_id, log_bulk_deletes FROM guild_log_settings WHERE guild_id=?", (guild_id,)) as cur:
-            row = await cur.fetchone()
-        if not row or not row[0]:
-            return None
-        new_val = 0 if row[1] else 1
-        await db.execute("UPDATE guild_log_settings SET log_bulk_deletes=? WHERE guild_id=?", (new_val, guild_id))
-        await db.commit()
-        return bool(new_val)
+    return await _toggle("log_bulk_deletes", guild_id)
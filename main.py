@@ -1,16 +1,24 @@
+import asyncio
+import calendar
+import heapq
+import logging
+import queue
+import time
 import discord
 from discord.ext import commands, tasks
-from datetime import datetime, timedelta
+from collections import defaultdict, deque
+from contextlib import aclosing
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from datetime import datetime, timedelta, UTC
 from dateutil import parser
-from dateutil.relativedelta import relativedelta
-import pytz
 import os
+import re
 from dotenv import load_dotenv
+from zoneinfo import ZoneInfo
 
 from database import *
 
-load_dotenv()
-
 intents = discord.Intents.default()
 intents.messages = True
 intents.message_content = True
@@ -19,31 +27,95 @@ intents.voice_states = True
 intents.guilds = True
 intents.invites = True
 
-guild_invites = {}
-
-bot = commands.Bot(command_prefix='!', intents=intents, help_command=None)
+guild_invites: dict[int, dict[str, int]] = {}  # guild_id -> {invite code: uses}
+
+LIST_ALARMS_LIMIT = 20  # keeps !listalarms inside Discord's embed size limit
+REPEAT_OPTIONS = frozenset({"daily", "weekly"})
+INVITE_FETCH_CONCURRENCY = 20  # parallel guild.invites() calls at startup
+ALARM_SEND_CONCURRENCY = 5  # parallel channel.send() calls when alarms fire together
+LOG_BATCH_SIZE = 20  # log lines per message sent by flush_logs
+DISCORD_MESSAGE_LIMIT = 2000
+PAUSED_ALARM_RETENTION = timedelta(days=30)  # paused one-time alarms this far past due are deleted
+
+# Pending log-channel lines, flushed by flush_logs: channel_id -> [text, ...]
+_log_queue: defaultdict[int, list[str]] = defaultdict(list)
+
+# Min-heap of (fire_epoch, alarm_id) wake-up hints for alarm_scheduler. The database
+# stays the source of truth: a stale entry (alarm deleted or moved) only costs one
+# empty due-check, so entries are never removed early.
+_alarm_heap: list[tuple[float, int]] = []
+_alarm_wakeup = asyncio.Event()
+_scheduler_task: asyncio.Task | None = None
+
+AUDIT_REFRESH_INTERVAL = 2  # min seconds between audit-log fetches per guild
+AUDIT_MATCH_WINDOW = timedelta(seconds=10)  # how old a new member_move entry may be
+
+# Moderator moves are read from the audit log in batches; moves fetched but not yet
+# matched to a voice event wait here as [entry, destination channel id, unmatched count]
+_pending_moves: dict[int, deque] = {}
+_audit_move_counts: dict[int, dict[int, int]] = {}  # guild_id -> {entry id: count} at last fetch
+_audit_fetched_at: dict[int, float] = {}
+
+class AlarmBot(commands.Bot):
+    async def close(self):
+        if _scheduler_task is not None:
+            _scheduler_task.cancel()
+        if flush_logs.is_running():
+            flush_logs.cancel()
+            await flush_logs()
+        await super().close()
+        await close_db()
+
+log = logging.getLogger("alarmbot")
+
+bot = AlarmBot(command_prefix='!', intents=intents, help_command=None)
 
 # ---------- Helpers ----------
-def ordinal(n: int) -> str:
+@lru_cache(maxsize=512)
+def _tz(name: str) -> ZoneInfo:
+    # there are < 600 IANA zones, so this never evicts in practice
+    return ZoneInfo(name)
+
+def _slow_ordinal(n: int) -> str:
     if 10 <= (n % 100) <= 20:
         suffix = "th"
     else:
         suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
     return f"{n}{suffix}"
 
+# Join positions below 10k (most guilds) come straight from this table
+_ORD = tuple(_slow_ordinal(i) for i in range(10001))
+
+def ordinal(n: int) -> str:
+    return _ORD[n] if 0 <= n < len(_ORD) else _slow_ordinal(n)
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    # clamps the day like relativedelta does: Jan 31 + 1 month = Feb 28/29
+    y, m = divmod(dt.month - 1 + months, 12)
+    year = dt.year + y
+    return dt.replace(year=year, month=m + 1, day=min(dt.day, calendar.monthrange(year, m + 1)[1]))
+
 def human_age(from_dt: datetime, to_dt: datetime) -> str:
     # returns "3 years, 10 months and 2 days ago"
     if from_dt > to_dt:
         from_dt, to_dt = to_dt, from_dt
-    rd = relativedelta(to_dt, from_dt)
+
+    # same years/months/days split as relativedelta(to_dt, from_dt)
+    months = (to_dt.year - from_dt.year) * 12 + to_dt.month - from_dt.month
+    anchor = _add_months(from_dt, months)
+    if anchor > to_dt:
+        months -= 1
+        anchor = _add_months(from_dt, months)
+    years, months = divmod(months, 12)
+    days = (to_dt - anchor).days
 
     parts = []
-    if rd.years:
-        parts.append(f"{rd.years} year{'s' if rd.years != 1 else ''}")
-    if rd.months:
-        parts.append(f"{rd.months} month{'s' if rd.months != 1 else ''}")
-    if rd.days:
-        parts.append(f"{rd.days} day{'s' if rd.days != 1 else ''}")
+    if years:
+        parts.append(f"{years} year{'s' if years != 1 else ''}")
+    if months:
+        parts.append(f"{months} month{'s' if months != 1 else ''}")
+    if days:
+        parts.append(f"{days} day{'s' if days != 1 else ''}")
 
     if not parts:
         return "just now"
@@ -54,63 +126,111 @@ def human_age(from_dt: datetime, to_dt: datetime) -> str:
         return parts[0] + " and " + parts[1] + " ago"
     return ", ".join(parts[:-1]) + " and " + parts[-1] + " ago"
 
+_DUR_RE = re.compile(r'^\s*(\d+)\s*([a-z]+)\s*$')
+_DUR_UNITS = {
+    "m": "minutes", "min": "minutes", "mins": "minutes", "minute": "minutes", "minutes": "minutes",
+    "h": "hours", "hr": "hours", "hrs": "hours", "hour": "hours", "hours": "hours",
+    "d": "days", "day": "days", "days": "days",
+}
+
 def parse_duration(s: str) -> timedelta | None:
     # supports: 10m, 2h, 1d
-    s = s.strip().lower()
-    if not s:
-        return None
-    num = ""
-    unit = ""
-    for ch in s:
-        if ch.isdigit():
-            num += ch
-        else:
-            unit += ch
-    if not num or not unit:
+    m = _DUR_RE.match(s.lower())
+    if not m:
         return None
-    n = int(num)
-    if unit in ("m", "min", "mins", "minute", "minutes"):
-        return timedelta(minutes=n)
-    if unit in ("h", "hr", "hrs", "hour", "hours"):
-        return timedelta(hours=n)
-    if unit in ("d", "day", "days"):
-        return timedelta(days=n)
-    return None
+    unit = _DUR_UNITS.get(m.group(2))
+    return timedelta(**{unit: int(m.group(1))}) if unit else None
+
+_CLOCK_RE = re.compile(r'^(\d{1,2})(?::(\d{2}))?\s*(?:([ap])\.?m\.?)?$', re.IGNORECASE)
 
-def compute_next_recurring_utc(alarm_time_utc_iso: str, user_tz_name: str, repeat: str) -> datetime:
+def parse_clock_time(s: str, now: datetime) -> datetime | None:
+    # Fast path for bare times of day ("9am", "15:30", "7:05 pm") on now's date.
+    # None means "not that shape": fall back to dateutil.
+    m = _CLOCK_RE.match(s)
+    if not m:
+        return None
+    hour = int(m.group(1))
+    minute = int(m.group(2) or 0)
+    ampm = m.group(3)
+    if ampm:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if ampm.lower() == "p" else 0)
+    elif m.group(2) is None:
+        return None  # a bare number is a day of the month to dateutil
+    if hour > 23 or minute > 59:
+        return None
+    return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+# opening -> closing quote, for times and messages wrapped in quotes
+_QUOTE_PAIRS = {'"': '"', "'": "'", '“': '”', '‘': '’'}
+
+def _unquote(s: str) -> str:
+    s = s.strip()
+    if len(s) >= 2 and _QUOTE_PAIRS.get(s[0]) == s[-1]:
+        s = s[1:-1].strip()
+    return s
+
+def _parse_time(s: str, now: datetime, default: datetime) -> datetime:
+    return parse_clock_time(s.strip(), now) or parser.parse(s, fuzzy=True, default=default)
+
+def split_time_and_message(s: str, now: datetime, default: datetime) -> tuple[datetime, str]:
+    # "<time> <message...>" -> (time, raw message text, "" if none). A quoted time
+    # ends at its closing quote. Otherwise the message starts at the first run of
+    # skipped words that follows text dateutil read as a time, and only the text
+    # before it is parsed again, so numbers or month names in the message
+    # ("Take 2 pills") can't move the date. Words skipped before the time ("next")
+    # stay part of it.
+    close = _QUOTE_PAIRS.get(s[:1])
+    if close and (end := s.find(close, 1)) != -1:
+        return _parse_time(s[1:end], now, default), s[end + 1:].strip()
+
+    parsed_time = parse_clock_time(s, now)
+    if parsed_time is not None:
+        return parsed_time, ""
+    parsed_time, skipped = parser.parse(s, fuzzy_with_tokens=True, default=default)
+    pos = 0
+    read_time = False
+    for fragment in skipped:
+        start = s.find(fragment, pos)
+        if start == -1:
+            break
+        read_time = read_time or bool(s[pos:start].strip())
+        if read_time and fragment.strip():
+            message_start = start + len(fragment) - len(fragment.lstrip())
+            return _parse_time(s[:message_start], now, default), s[message_start:].strip()
+        pos = start + len(fragment)
+    return parsed_time, ""
+
+def compute_next_recurring_utc(alarm_time_utc_iso: str, user_tz_name: str, repeat: str,
+                               after: datetime | None = None) -> datetime:
     """
     DST-safe:
     - Convert stored UTC time to user's tz
-    - Add 1 day / 1 week in *local tz*
-    - Normalize, then convert back to UTC for storage
+    - Add 1 day / 1 week in *local tz* (zoneinfo does wall-clock arithmetic)
+    - If that is still not later than `after`, skip whole periods past it so
+      occurrences missed while offline fire once, on the original cadence
+    - Convert back to UTC for storage
     """
-    tz = pytz.timezone(user_tz_name)
+    tz = _tz(user_tz_name)
     old_utc = datetime.fromisoformat(alarm_time_utc_iso)
     if old_utc.tzinfo is None:
-        old_utc = pytz.UTC.localize(old_utc)
+        old_utc = old_utc.replace(tzinfo=UTC)
 
     local = old_utc.astimezone(tz)
+    step = timedelta(weeks=1) if repeat == "weekly" else timedelta(days=1)
+    local_next = local + step
 
-    if repeat == "daily":
-        local_next = local + timedelta(days=1)
-    elif repeat == "weekly":
-        local_next = local + timedelta(weeks=1)
-    else:
-        local_next = local + timedelta(days=1)
+    if after is not None:
+        # both sides in the same zone compare (and subtract) as wall-clock times
+        after_local = after.astimezone(tz)
+        if local_next <= after_local:
+            local_next += ((after_local - local_next) // step + 1) * step
 
-    # pytz normalize handles DST transitions
-    local_next = tz.normalize(local_next)
-    return local_next.astimezone(pytz.UTC)
+    return local_next.astimezone(UTC)
 
 # ---------- Help ----------
-@bot.command(name='alarmhelp')
-async def custom_help(ctx):
-    help_embed = discord.Embed(
-        title="Alarm Bot Commands Help",
-        description="Times are handled in your set timezone (default: UTC)",
-        color=discord.Color.blue()
-    )
-
+def _build_help_embed() -> discord.Embed:
     basic_commands = {
         '!alarmhelp': 'Shows this help message',
         '!settimezone <timezone>': 'Example: Asia/Dhaka, America/New_York',
@@ -120,7 +240,8 @@ async def custom_help(ctx):
         '!deletealarm <id>': 'Deletes an alarm',
         '!editalarm <id> <new time> [daily|weekly] [message...]': 'Edit time/repeat/message',
         '!snooze <id> <10m|2h|1d>': 'Snooze an alarm',
-        '!pausealarm <id>': 'Pause an alarm (recurring or one-time)',
+        '!pausealarm <id>': 'Pause an alarm (recurring or one-time; paused one-time '
+                            f'alarms are removed {PAUSED_ALARM_RETENTION.days} days after their time)',
         '!resumealarm <id>': 'Resume an alarm'
     }
 
@@ -131,25 +252,38 @@ async def custom_help(ctx):
         '!togglebulkdeletelog': 'Toggle bulk delete logging (admin)'
     }
 
-    help_embed.add_field(name="Basic Commands", value="‎", inline=False)
-    for cmd, desc in basic_commands.items():
-        help_embed.add_field(name=cmd, value=desc, inline=False)
+    # One markdown description instead of a field per command
+    description = "\n".join([
+        "Times are handled in your set timezone (default: UTC)",
+        "",
+        "**Basic Commands**",
+        *(f"`{cmd}` — {desc}" for cmd, desc in basic_commands.items()),
+        "",
+        "**Admin Commands**",
+        *(f"`{cmd}` — {desc}" for cmd, desc in admin_commands.items()),
+    ])
+    return discord.Embed(
+        title="Alarm Bot Commands Help",
+        description=description,
+        color=discord.Color.blue()
+    )
 
-    help_embed.add_field(name="Admin Commands", value="‎", inline=False)
-    for cmd, desc in admin_commands.items():
-        help_embed.add_field(name=cmd, value=desc, inline=False)
+# Static content, so built once and reused for every !alarmhelp
+_HELP_EMBED = _build_help_embed()
 
-    await ctx.send(embed=help_embed)
+@bot.command(name='alarmhelp')
+async def custom_help(ctx):
+    await ctx.send(embed=_HELP_EMBED)
 
 # ---------- Timezone ----------
 @bot.command(name='settimezone')
 async def set_timezone(ctx, timezone: str):
-    try:
-        pytz.timezone(timezone)
-        await set_user_timezone(ctx.author.id, timezone)
-        await ctx.send(f'(⊙_⊙)？ Timezone set to {timezone}')
-    except pytz.UnknownTimeZoneError:
+    name = canonical_timezone(timezone)
+    if name is None:
         await ctx.send('~_~ Invalid timezone. Use format like "Continent/City"')
+        return
+    await set_user_timezone(ctx.author.id, name)
+    await ctx.send(f'(⊙_⊙)？ Timezone set to {name}')
 
 @bot.command(name='gettimezone')
 async def get_timezone(ctx):
@@ -169,88 +303,55 @@ async def set_alarm(ctx, *, raw: str):
     try:
         user_id = ctx.author.id
         timezone = await get_user_timezone(user_id)
-        tz = pytz.timezone(timezone)
+        tz = _tz(timezone)
         now = datetime.now(tz)
+        now_ts = now.timestamp()
+        # dateutil fills missing fields from default; midnight keeps "9am" from
+        # inheriting the current minutes and seconds
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        tokens = raw.strip().split()
-        repeat = None
-        repeat_candidates = {"daily", "weekly"}
+        # If user wrote: !setalarm <time> <message...>
+        # the words after the time become the message. A delimiter makes it
+        # explicit: !setalarm <time> | <message...>
+        left, sep, right = raw.partition("|")
+        message = right.strip() or "Alarm!"
+        tokens = left.split()
 
         # Try detect repeat token anywhere; best effort:
-        # If last tokens include daily/weekly, treat it as repeat.
         # We'll prefer the first occurrence.
+        repeat = None
         for i, t in enumerate(tokens):
             tl = t.lower()
-            if tl in repeat_candidates:
+            if tl in REPEAT_OPTIONS:
                 repeat = tl
                 tokens.pop(i)
                 break
 
-        time_str = " ".join(tokens).strip()
-        message = "Alarm!"
+        time_str = " ".join(tokens)
 
-        # If user wrote: !setalarm <time> <message...>
-        # We parse time using dateutil fuzzy; it can handle extra words,
-        # but we want message support. So we do this:
-        # - Parse using full string, but we also allow a delimiter: |
-        if "|" in raw:
-            left, right = raw.split("|", 1)
-            left = left.strip()
-            right = right.strip()
-            # re-detect repeat on left side
-            ltoks = left.split()
-            repeat = None
-            for i, t in enumerate(list(ltoks)):
-                tl = t.lower()
-                if tl in repeat_candidates:
-                    repeat = tl
-                    ltoks.pop(i)
-                    break
-            time_str = " ".join(ltoks).strip()
-            message = right if right else "Alarm!"
-        else:
-            # If there are many words, user probably included a message.
-            # We'll parse time from the front, and treat the remainder as message.
-            # Heuristic: progressively extend time phrase until parse succeeds with confidence.
-            # We'll do a simple split: try first 1..N tokens as time, remaining as message.
-            best_time = None
-            best_k = None
-            for k in range(1, min(len(tokens), 8) + 1):
-                candidate = " ".join(tokens[:k])
-                try:
-                    parsed = parser.parse(candidate, fuzzy=False, default=now)
-                    best_time = parsed
-                    best_k = k
-                except Exception:
-                    continue
-            if best_time is None:
-                # fallback: let dateutil fuzzy parse entire string as time
-                best_time = parser.parse(time_str, fuzzy=True, default=now)
-                best_k = len(tokens)
-
-            parsed_time = best_time
-            msg_tokens = tokens[best_k:]
-            if msg_tokens:
-                message = " ".join(msg_tokens).strip()
-
-        parsed_time = parser.parse(time_str, fuzzy=True, default=now)
+        parsed_time, trailing = split_time_and_message(time_str, now, today)
+        if not sep:
+            message = _unquote(trailing) or "Alarm!"
 
         if parsed_time.tzinfo is None:
-            parsed_time = tz.localize(parsed_time)
+            parsed_time = parsed_time.replace(tzinfo=tz)
 
-        if parsed_time <= now:
+        # compare as POSIX timestamps; fire_ts also feeds the scheduler
+        fire_ts = parsed_time.timestamp()
+        if fire_ts <= now_ts:
             # push to next day if needed
             parsed_time = parsed_time + timedelta(days=1)
-            parsed_time = tz.normalize(parsed_time)
+            fire_ts = parsed_time.timestamp()
 
         alarm_id = await add_alarm(
             user_id=user_id,
-            time_utc=parsed_time.astimezone(pytz.UTC),
+            time_utc=parsed_time.astimezone(UTC),
             message=message,
             channel_id=ctx.channel.id,
             timezone=timezone,
             repeat=repeat
         )
+        schedule_alarm(fire_ts, alarm_id)
 
         await ctx.send(
             f"(＞﹏＜ Alarm set for {parsed_time.strftime('%Y-%m-%d %H:%M')} ({timezone})\n"
@@ -264,39 +365,41 @@ async def set_alarm(ctx, *, raw: str):
 
 @bot.command(name='listalarms')
 async def list_alarms(ctx):
-    alarms = await get_user_alarms(ctx.author.id)
-    if not alarms:
-        await ctx.send("(￣o￣).zZ  No active alarms")
-        return
-
-    timezone = pytz.timezone(await get_user_timezone(ctx.author.id))
+    timezone = _tz(await get_user_timezone(ctx.author.id))
     alarm_list = []
+    more = False
 
-    for alarm in alarms:
-        local_time = datetime.fromisoformat(alarm['time'])
-        if local_time.tzinfo is None:
-            local_time = pytz.UTC.localize(local_time)
-        local_time = local_time.astimezone(timezone)
-
-        repeat_str = f" (Repeats {alarm['repeat']})" if alarm['repeat'] else ""
-        paused_str = " [PAUSED]" if alarm.get("paused") else ""
-        alarm_list.append(
-            f"**ID {alarm['id']}**{paused_str} - {local_time.strftime('%a %b %d %H:%M')}{repeat_str}\n"
-            f"Message: {alarm['message']}"
-        )
+    async with aclosing(iter_user_alarms(ctx.author.id)) as alarms:
+        async for alarm in alarms:
+            if len(alarm_list) == LIST_ALARMS_LIMIT:
+                more = True
+                break
+
+            local_time = datetime.fromtimestamp(alarm['time_epoch'], timezone)
+
+            repeat_str = f" (Repeats {alarm['repeat']})" if alarm['repeat'] else ""
+            paused_str = " [PAUSED]" if alarm.get("paused") else ""
+            alarm_list.append(
+                f"**ID {alarm['id']}**{paused_str} - {local_time.strftime('%a %b %d %H:%M')}{repeat_str}\n"
+                f"Message: {alarm['message']}"
+            )
+
+    if not alarm_list:
+        await ctx.send("(￣o￣).zZ  No active alarms")
+        return
 
     embed = discord.Embed(
         title="Your Active Alarms",
         description="\n\n".join(alarm_list),
         color=discord.Color.gold()
     )
+    if more:
+        embed.set_footer(text=f"Showing your next {LIST_ALARMS_LIMIT} alarms")
     await ctx.send(embed=embed)
 
 @bot.command(name='deletealarm')
 async def delete_alarm_command(ctx, alarm_id: int):
-    user_alarms = await get_user_alarms(ctx.author.id)
-    if any(a['id'] == alarm_id for a in user_alarms):
-        await delete_alarm(alarm_id)
+    if await delete_alarm_if_owned(ctx.author.id, alarm_id):
         await ctx.send(f"✅ Alarm {alarm_id} deleted")
     else:
         await ctx.send("~_~ Alarm not found")
@@ -309,54 +412,52 @@ async def edit_alarm_command(ctx, alarm_id: int, *, raw: str):
     Tip: Use delimiter:
       !editalarm 3 tomorrow 9am daily | Wake up!
     """
-    user_alarms = await get_user_alarms(ctx.author.id)
-    alarm = next((a for a in user_alarms if a["id"] == alarm_id), None)
+    alarm = await get_alarm(alarm_id, ctx.author.id)
     if not alarm:
         await ctx.send("~_~ Alarm not found")
         return
 
     timezone = await get_user_timezone(ctx.author.id)
-    tz = pytz.timezone(timezone)
+    tz = _tz(timezone)
     now = datetime.now(tz)
+    now_ts = now.timestamp()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    repeat_candidates = {"daily", "weekly"}
-    repeat = None
     message = alarm["message"]
-
-    if "|" in raw:
-        left, right = raw.split("|", 1)
-        left = left.strip()
-        right = right.strip()
-        message = right if right else message
-        tokens = left.split()
-    else:
-        tokens = raw.split()
+    left, _, right = raw.partition("|")
+    message = right.strip() or message
+    tokens = left.split()
 
     # detect repeat
-    for i, t in enumerate(list(tokens)):
+    repeat = None
+    for i, t in enumerate(tokens):
         tl = t.lower()
-        if tl in repeat_candidates:
+        if tl in REPEAT_OPTIONS:
             repeat = tl
             tokens.pop(i)
             break
 
-    time_str = " ".join(tokens).strip()
+    time_str = " ".join(tokens)
     if not time_str:
         await ctx.send("~_~ Provide a new time. Example: `!editalarm 2 tomorrow 9am daily | Wake up!`")
         return
 
     try:
-        parsed_time = parser.parse(time_str, fuzzy=True, default=now)
+        parsed_time = parse_clock_time(time_str, now) or parser.parse(time_str, fuzzy=True, default=today)
         if parsed_time.tzinfo is None:
-            parsed_time = tz.localize(parsed_time)
-        if parsed_time <= now:
-            parsed_time = tz.normalize(parsed_time + timedelta(days=1))
+            parsed_time = parsed_time.replace(tzinfo=tz)
+        fire_ts = parsed_time.timestamp()
+        if fire_ts <= now_ts:
+            parsed_time = parsed_time + timedelta(days=1)
+            fire_ts = parsed_time.timestamp()
 
         # if user didn't mention repeat, keep existing repeat
         if repeat is None:
             repeat = alarm["repeat"]
 
-        await update_alarm(alarm_id, parsed_time.astimezone(pytz.UTC), repeat, message)
+        await update_alarm(alarm_id, parsed_time.astimezone(UTC), repeat, message)
+        if not alarm["paused"]:
+            schedule_alarm(fire_ts, alarm_id)
         await ctx.send(f"✅ Alarm {alarm_id} updated to {parsed_time.strftime('%Y-%m-%d %H:%M')} ({timezone})"
                        + (f" repeat={repeat}" if repeat else ""))
     except Exception:
@@ -364,8 +465,7 @@ async def edit_alarm_command(ctx, alarm_id: int, *, raw: str):
 
 @bot.command(name='snooze')
 async def snooze_command(ctx, alarm_id: int, duration: str):
-    user_alarms = await get_user_alarms(ctx.author.id)
-    if not any(a["id"] == alarm_id for a in user_alarms):
+    if not await alarm_exists(alarm_id, ctx.author.id):
         await ctx.send("~_~ Alarm not found")
         return
 
@@ -374,13 +474,16 @@ async def snooze_command(ctx, alarm_id: int, duration: str):
         await ctx.send("~_~ Invalid duration. Use like `10m`, `2h`, `1d`")
         return
 
-    ok = await snooze_alarm(alarm_id, delta)
-    await ctx.send("✅ Snoozed" if ok else "~_~ Alarm not found")
+    new_epoch = await snooze_alarm(alarm_id, delta)
+    if new_epoch is None:
+        await ctx.send("~_~ Alarm not found")
+        return
+    schedule_alarm(new_epoch, alarm_id)
+    await ctx.send("✅ Snoozed")
 
 @bot.command(name='pausealarm')
 async def pause_alarm_cmd(ctx, alarm_id: int):
-    user_alarms = await get_user_alarms(ctx.author.id)
-    if not any(a["id"] == alarm_id for a in user_alarms):
+    if not await alarm_exists(alarm_id, ctx.author.id):
         await ctx.send("~_~ Alarm not found")
         return
     await set_alarm_paused(alarm_id, True)
@@ -388,11 +491,12 @@ async def pause_alarm_cmd(ctx, alarm_id: int):
 
 @bot.command(name='resumealarm')
 async def resume_alarm_cmd(ctx, alarm_id: int):
-    user_alarms = await get_user_alarms(ctx.author.id)
-    if not any(a["id"] == alarm_id for a in user_alarms):
+    alarm = await get_alarm(alarm_id, ctx.author.id)
+    if not alarm:
         await ctx.send("~_~ Alarm not found")
         return
     await set_alarm_paused(alarm_id, False)
+    schedule_alarm(alarm["time_epoch"], alarm_id)
     await ctx.send(f"▶️ Alarm {alarm_id} resumed")
 
 # ---------- Admin Logging Controls ----------
@@ -443,6 +547,38 @@ async def on_command_error(ctx, error):
     await ctx.send("~_~ Something went wrong.")
     raise error
 
+def queue_log(channel, text: str):
+    # Log lines are sent in batches by flush_logs instead of one message per event
+    _log_queue[channel.id].append(text)
+
+def _pack_log_lines(lines: list[str]) -> list[str]:
+    messages = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and (len(current) == LOG_BATCH_SIZE or size + 1 + len(line) > DISCORD_MESSAGE_LIMIT):
+            messages.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(line[:DISCORD_MESSAGE_LIMIT])
+        size += len(current[-1]) + 1
+    if current:
+        messages.append("\n".join(current))
+    return messages
+
+@tasks.loop(seconds=1)
+async def flush_logs():
+    for channel_id in list(_log_queue):
+        lines = _log_queue.pop(channel_id)
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            continue
+        try:
+            for text in _pack_log_lines(lines):
+                await channel.send(text)
+        except Exception:
+            log.exception("Error sending logs to %s", channel_id)
+
 @bot.event
 async def on_message_delete(message):
     if message.author.bot or not message.guild:
@@ -458,8 +594,9 @@ async def on_message_delete(message):
 
     channel = bot.get_channel(channel_id)
     if channel:
-        content = (message.content or "").replace('`', "'")[:900]
-        await channel.send(
+        content = (message.content or "")[:900].replace('`', "'")
+        queue_log(
+            channel,
             f"🗑️ Message deleted in {message.channel.mention} by {message.author.mention}:\n"
             f"```{content}```"
         )
@@ -491,7 +628,8 @@ async def on_bulk_message_delete(messages):
             sample.append(f"{m.author}: {(m.content or '')[:80]}")
     text = "\n".join(sample) if sample else "No text content (or only bots)."
 
-    await log_channel.send(
+    queue_log(
+        log_channel,
         f"🧹 Bulk delete in {first.channel.mention} — {len(messages)} messages\n"
         f"```{text}```"
     )
@@ -518,7 +656,8 @@ async def on_message_edit(before, after):
     old = (before.content or "")[:800].replace("`", "'")
     new = (after.content or "")[:800].replace("`", "'")
 
-    await log_channel.send(
+    queue_log(
+        log_channel,
         f"✏️ Message edited in {before.channel.mention} by {before.author.mention}\n"
         f"**Before:**\n```{old}```\n"
         f"**After:**\n```{new}```"
@@ -528,20 +667,25 @@ async def on_message_edit(before, after):
 async def on_guild_join(guild):
     try:
         invites = await guild.invites()
-        guild_invites[guild.id] = {invite.code: invite for invite in invites}
+        guild_invites[guild.id] = {invite.code: invite.uses for invite in invites}
     except Exception as e:
-        print(f"Error fetching invites for new guild {guild}: {e}")
+        log.warning("Error fetching invites for new guild %s: %s", guild, e)
+
+@bot.event
+async def on_guild_remove(guild):
+    # drop per-guild caches so guilds the bot has left don't linger in memory
+    guild_invites.pop(guild.id, None)
+    _pending_moves.pop(guild.id, None)
+    _audit_move_counts.pop(guild.id, None)
+    _audit_fetched_at.pop(guild.id, None)
 
 @bot.event
 async def on_invite_create(invite):
-    guild_invites.setdefault(invite.guild.id, {})
-    guild_invites[invite.guild.id][invite.code] = invite
+    guild_invites.setdefault(invite.guild.id, {})[invite.code] = invite.uses or 0
 
 @bot.event
 async def on_invite_delete(invite):
-    g = invite.guild.id
-    if g in guild_invites and invite.code in guild_invites[g]:
-        del guild_invites[g][invite.code]
+    guild_invites.get(invite.guild.id, {}).pop(invite.code, None)
 
 @bot.event
 async def on_member_join(member):
@@ -555,19 +699,24 @@ async def on_member_join(member):
         return
 
     # --- Invite tracking (best effort) ---
+    # Discord doesn't push invite use counts, so finding the invite means one
+    # guild.invites() call. Skip it when it can't succeed (no Manage Server) or
+    # can't find anything (invites were loaded and on_invite_create saw none since).
     used_invite = None
-    try:
-        cached = guild_invites.get(guild.id, {})
-        actual = {invite.code: invite for invite in await guild.invites()}
-        guild_invites[guild.id] = actual
-
-        for code, new_invite in actual.items():
-            old_invite = cached.get(code)
-            if not old_invite or new_invite.uses > old_invite.uses:
-                used_invite = new_invite
-                break
-    except Exception as e:
-        print(f"Invite check error: {e}")
+    cached = guild_invites.get(guild.id)
+    if guild.me.guild_permissions.manage_guild and cached != {}:
+        try:
+            cached = cached or {}
+            actual = await guild.invites()
+            guild_invites[guild.id] = {invite.code: invite.uses for invite in actual}
+
+            for invite in actual:
+                # a code we never saw counts as used, as before
+                if invite.uses > cached.get(invite.code, -1):
+                    used_invite = invite
+                    break
+        except Exception as e:
+            log.warning("Invite check error: %s", e)
 
     # --- Requested join log format ---
     # Example wanted:
@@ -597,7 +746,7 @@ async def on_member_join(member):
         inviter = used_invite.inviter
         extra = f"\nInvite: `{used_invite.code}` by {inviter.mention} (uses: {used_invite.uses})"
 
-    await log_channel.send(f"{line1}\n{line2}\n{line3}\n{line4}{extra}")
+    queue_log(log_channel, f"{line1}\n{line2}\n{line3}\n{line4}{extra}")
 
 @bot.event
 async def on_member_remove(member):
@@ -607,7 +756,47 @@ async def on_member_remove(member):
         return
     log_channel = bot.get_channel(settings[0])
     if log_channel:
-        await log_channel.send(f"**Member left**\n{member.mention}\nID: {member.id}")
+        queue_log(log_channel, f"**Member left**\n{member.mention}\nID: {member.id}")
+
+def _take_pending_move(guild_id: int, channel_id: int):
+    for pending in _pending_moves.get(guild_id, ()):
+        entry, dest_id, left = pending
+        if dest_id == channel_id and left > 0:
+            pending[2] -= 1
+            return entry
+    return None
+
+async def find_voice_mover(guild, channel_id: int):
+    """
+    Audit-log entry for a moderator moving someone into channel_id, or None.
+    Discord logs these as member_move entries that only name the destination and
+    bump entry.extra.count when the same moderator repeats the move, so a move is
+    new if its entry appeared recently or its count grew since the last fetch.
+    """
+    entry = _take_pending_move(guild.id, channel_id)
+    if entry or not guild.me.guild_permissions.view_audit_log:
+        return entry
+    now = time.monotonic()
+    if now - _audit_fetched_at.get(guild.id, 0) < AUDIT_REFRESH_INTERVAL:
+        return None
+    _audit_fetched_at[guild.id] = now
+
+    seen = _audit_move_counts.get(guild.id, {})
+    recent = discord.utils.utcnow() - AUDIT_MATCH_WINDOW
+    counts = {}
+    pending = deque()
+    async for entry in guild.audit_logs(action=discord.AuditLogAction.member_move, limit=8):
+        count = entry.extra.count
+        counts[entry.id] = count
+        if entry.id in seen:
+            new = count - seen[entry.id]
+        else:
+            new = count if entry.created_at >= recent else 0
+        if new > 0 and entry.extra.channel:
+            pending.append([entry, entry.extra.channel.id, new])
+    _audit_move_counts[guild.id] = counts
+    _pending_moves[guild.id] = pending
+    return _take_pending_move(guild.id, channel_id)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
@@ -628,94 +817,199 @@ async def on_voice_state_update(member, before, after):
     try:
         # If moved between channels, try detect moderator move using audit logs
         if before.channel and after.channel:
-            moved_by_mod = False
-            async for entry in member.guild.audit_logs(action=discord.AuditLogAction.member_update, limit=8):
-                if entry.target and entry.target.id == member.id:
-                    for change in entry.changes:
-                        if change.key == 'voice_channel':
-                            old_id = change.old_value.id if change.old_value else None
-                            new_id = change.new_value.id if change.new_value else None
-                            if old_id == before.channel.id and new_id == after.channel.id:
-                                moved_by_mod = True
-                                reason = entry.reason or "No reason provided"
-                                await log_channel.send(
-                                    f"🎤 {member.mention} was moved by {entry.user.mention} "
-                                    f"from {before.channel.mention} to {after.channel.mention}\n"
-                                    f"**Reason:** {reason}"
-                                )
-                                break
-                    if moved_by_mod:
-                        break
-
-            if not moved_by_mod:
-                await log_channel.send(f"🎤 {member.mention} moved from {before.channel.mention} to {after.channel.mention}")
+            entry = await find_voice_mover(member.guild, after.channel.id)
+            if entry:
+                reason = entry.reason or "No reason provided"
+                queue_log(
+                    log_channel,
+                    f"🎤 {member.mention} was moved by {entry.user.mention} "
+                    f"from {before.channel.mention} to {after.channel.mention}\n"
+                    f"**Reason:** {reason}"
+                )
+            else:
+                queue_log(log_channel, f"🎤 {member.mention} moved from {before.channel.mention} to {after.channel.mention}")
 
         elif not before.channel and after.channel:
-            await log_channel.send(f"🎤 {member.mention} joined {after.channel.mention} 🔊")
+            queue_log(log_channel, f"🎤 {member.mention} joined {after.channel.mention} 🔊")
 
         elif before.channel and not after.channel:
-            await log_channel.send(f"🎤 {member.mention} left {before.channel.mention} 🔇")
+            queue_log(log_channel, f"🎤 {member.mention} left {before.channel.mention} 🔇")
 
     except discord.Forbidden:
         # Missing View Audit Log etc.
         if before.channel and after.channel:
-            await log_channel.send(f"🎤 {member.mention} moved from {before.channel.mention} to {after.channel.mention}")
-    except Exception as e:
-        print(f"Error handling voice state update: {e}")
-
-# ---------- Alarm Checker ----------
-@tasks.loop(seconds=10)
-async def check_alarms():
-    due_alarms = await get_due_alarms()
-    for alarm in due_alarms:
+            queue_log(log_channel, f"🎤 {member.mention} moved from {before.channel.mention} to {after.channel.mention}")
+    except Exception:
+        log.exception("Error handling voice state update")
+
+# ---------- Alarm Scheduler ----------
+def schedule_alarm(fire_epoch: float, alarm_id: int):
+    entry = (fire_epoch, alarm_id)
+    heapq.heappush(_alarm_heap, entry)
+    if _alarm_heap[0] == entry:
+        # new earliest alarm; the scheduler may be sleeping towards a later one
+        _alarm_wakeup.set()
+
+async def alarm_scheduler():
+    # Sleeps until the earliest heap entry is due instead of polling the database
+    resolution = time.get_clock_info("monotonic").resolution
+    while True:
+        _alarm_wakeup.clear()
+        now = time.time()
+        if _alarm_heap and _alarm_heap[0][0] <= now:
+            popped = []
+            while _alarm_heap and _alarm_heap[0][0] <= now:
+                popped.append(heapq.heappop(_alarm_heap)[1])
+            try:
+                await fire_due_alarms()
+            except Exception:
+                log.exception("Error firing due alarms")
+                # the rows are still due in the database; try them again shortly
+                retry_at = time.time() + 10
+                for alarm_id in popped:
+                    heapq.heappush(_alarm_heap, (retry_at, alarm_id))
+            continue
+
+        # asyncio may fire a timer up to one clock tick early; pad so a wake-up
+        # always finds the head due instead of re-sleeping for a sliver
+        timeout = _alarm_heap[0][0] - now + resolution if _alarm_heap else None
         try:
-            channel = bot.get_channel(alarm['channel_id']) if alarm['channel_id'] else None
+            await asyncio.wait_for(_alarm_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def fire_due_alarms():
+    cutoff = datetime.now(UTC)
+    due_alarms = await get_due_alarms(cutoff)
+    updates = []
+    deletes = []
+    add_update = updates.append
+    add_delete = deletes.append
+    # sends go out concurrently, a few at a time to stay inside Discord's rate limits
+    sem = asyncio.Semaphore(ALARM_SEND_CONCURRENCY)
+
+    async def fire(alarm):
+        try:
+            channel = bot.get_channel(alarm.channel_id) if alarm.channel_id else None
             if not channel:
                 # channel missing; delete one-time alarms, keep recurring but pause
-                if alarm['repeat']:
-                    await set_alarm_paused(alarm['id'], True)
+                if alarm.repeat:
+                    await set_alarm_paused(alarm.id, True)
                 else:
-                    await delete_alarm(alarm['id'])
-                continue
-
-            user = await bot.fetch_user(alarm['user_id'])
-            await channel.send(f"🔔 {user.mention} **ALARM**: {alarm['message']}")
-
-            if alarm['repeat']:
-                next_time_utc = compute_next_recurring_utc(alarm['time'], alarm['timezone'], alarm['repeat'])
-                await update_alarm_time(alarm['id'], next_time_utc)
+                    add_delete(alarm.id)
+                return
+
+            # a mention only needs the id, so no user lookup (or fetch_user HTTP call)
+            async with sem:
+                await channel.send(f"🔔 <@{alarm.user_id}> **ALARM**: {alarm.message}")
+
+            if alarm.repeat:
+                # UTC alarms are rolled over in bulk by advance_repeating_due below
+                if alarm.timezone != 'UTC':
+                    next_time_utc = compute_next_recurring_utc(alarm.time, alarm.timezone, alarm.repeat, cutoff)
+                    add_update((next_time_utc, alarm.id))
             else:
-                await delete_alarm(alarm['id'])
+                add_delete(alarm.id)
 
-        except Exception as e:
-            print(f"Error triggering alarm {alarm.get('id')}: {e}")
+        except Exception:
+            log.exception("Error triggering alarm %s", alarm.id)
             # safest: delete one-time; pause recurring
-            if alarm.get('repeat'):
-                await set_alarm_paused(alarm['id'], True)
+            if alarm.repeat:
+                await set_alarm_paused(alarm.id, True)
             else:
-                await delete_alarm(alarm['id'])
+                add_delete(alarm.id)
+
+    # one alarm's failure (even from the pause in its error path) must not skip the
+    # bookkeeping below, or every alarm that did send would be sent again
+    results = await asyncio.gather(*(fire(alarm) for alarm in due_alarms), return_exceptions=True)
+    for alarm, result in zip(due_alarms, results):
+        if isinstance(result, Exception):
+            log.error("Error handling failed alarm %s", alarm.id, exc_info=result)
+
+    if updates or deletes:
+        await reschedule_due(updates, deletes)
+    for next_time_utc, alarm_id in updates:
+        schedule_alarm(next_time_utc.timestamp(), alarm_id)
+    if due_alarms:
+        for next_epoch, alarm_id in await advance_repeating_due(cutoff):
+            schedule_alarm(next_epoch, alarm_id)
+
+@tasks.loop(hours=24)
+async def cleanup_alarms():
+    try:
+        await cleanup_expired_alarms(PAUSED_ALARM_RETENTION)
+    except Exception:
+        log.exception("Error cleaning up expired alarms")
 
 # ---------- Startup ----------
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user} (ID: {bot.user.id})')
+    global _scheduler_task
+    log.info("Logged in as %s (ID: %s)", bot.user, bot.user.id)
     await bot.change_presence(status=discord.Status.online)
 
     await init_db()
-    if not check_alarms.is_running():
-        check_alarms.start()
+    await load_log_settings()
+    if _scheduler_task is None:
+        _alarm_heap.extend(await get_alarm_schedule())
+        heapq.heapify(_alarm_heap)
+        _scheduler_task = asyncio.create_task(alarm_scheduler())
+    if not cleanup_alarms.is_running():
+        cleanup_alarms.start()
+    if not flush_logs.is_running():
+        flush_logs.start()
+
+    # cache invites, a bounded number of guilds at a time
+    sem = asyncio.Semaphore(INVITE_FETCH_CONCURRENCY)
+
+    async def cache_invites(guild):
+        async with sem:
+            try:
+                invites = await guild.invites()
+                guild_invites[guild.id] = {invite.code: invite.uses for invite in invites}
+            except Exception as e:
+                log.warning("Error initializing invites for %s: %s", guild, e)
+
+    await asyncio.gather(*(cache_invites(guild) for guild in bot.guilds))
+
+def setup_logging() -> QueueListener:
+    # Handlers write to stderr on the listener's thread, so a log call from the
+    # event loop only enqueues the record
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    log.addHandler(QueueHandler(log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+def main():
+    load_dotenv()
+    listener = setup_logging()
+    # bot.run() would set this up, but the loop is started here so uvloop can be
+    # picked without uvloop.install(), which is deprecated from Python 3.12
+    discord.utils.setup_logging()
+    try:
+        from uvloop import run  # optional; a faster drop-in event loop
+    except ImportError:
+        from asyncio import run
 
-    # cache invites
-    for guild in bot.guilds:
-        try:
-            invites = await guild.invites()
-            guild_invites[guild.id] = {invite.code: invite for invite in invites}
-        except Exception as e:
-            print(f"Error initializing invites for {guild}: {e}")
-
-try:
-    bot.run(os.getenv('DISCORD_TOKEN'))
-except discord.LoginFailure:
-    print("~_~ Invalid token - check your DISCORD_TOKEN")
-except Exception as e:
-    print(f"~_~ Error starting bot: {e}")
+    async def runner():
+        async with bot:
+            await bot.start(os.getenv('DISCORD_TOKEN'))
+
+    try:
+        run(runner())
+    except KeyboardInterrupt:
+        pass
+    except discord.LoginFailure:
+        log.error("Invalid token - check your DISCORD_TOKEN")
+    except Exception:
+        log.exception("Error starting bot")
+    finally:
+        listener.stop()
+
+if __name__ == "__main__":
+    main()